@@ -13,6 +13,10 @@ Key Points:
 
 https://refactoring.guru/design-patterns/memento
 """
+import mmap
+import os
+import struct
+from contextlib import contextmanager
 from dataclasses import dataclass
 from copy import copy
 
@@ -23,12 +27,89 @@ class State:
     r2: int
 
 
+"""
+For long histories the mementos do not have to live in memory. Since a State is just two integers, it can be stored as
+a fixed-width record in a memory-mapped file: any step can be reached in O(1) by its offset, records are only decoded
+when undo or redo asks for them, and the history survives a restart of the process.
+"""
+
+
+class MappedMemento:
+    header = struct.Struct("<Q")
+    record = struct.Struct("<qq")
+
+    def __init__(self, path: str, capacity: int = 1024):
+        exists = os.path.exists(path) and os.path.getsize(path) >= self.header.size
+        self.file = open(path, "r+b" if exists else "w+b")
+        if not exists:
+            self.file.truncate(self.header.size + capacity * self.record.size)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.capacity = (len(self.map) - self.header.size) // self.record.size
+        (self.size,) = self.header.unpack_from(self.map, 0)
+
+    def append(self, state: State):
+        if self.size == self.capacity:
+            self.grow()
+        self.record.pack_into(self.map, self.header.size + self.size * self.record.size, state.r1, state.r2)
+        self.size += 1
+        self.header.pack_into(self.map, 0, self.size)
+
+    def grow(self):
+        self.capacity = max(1, self.capacity * 2)
+        self.map.close()
+        self.file.truncate(self.header.size + self.capacity * self.record.size)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+
+    def __getitem__(self, idx: int) -> State:
+        if idx < 0:
+            idx += self.size
+        if not 0 <= idx < self.size:
+            raise IndexError("Memento index out of range.")
+        return State(*self.record.unpack_from(self.map, self.header.size + idx * self.record.size))
+
+    def __len__(self):
+        return self.size
+
+    def close(self):
+        self.map.flush()
+        self.map.close()
+        self.file.close()
+
+
 class Computer:
 
-    def __init__(self):
-        self.state = State(0, 0)
-        self.memento = [copy(self.state)]
-        self.idx = 0
+    def __init__(self, memento=None):
+        self.memento = [State(0, 0)] if memento is None else memento
+        if len(self.memento) == 0:
+            self.memento.append(State(0, 0))
+        self.idx = len(self.memento) - 1
+        self.state = copy(self.memento[self.idx])
+        self.batching = False
+
+    def snapshot(self):
+        if not self.batching:
+            self.memento.append(copy(self.state))
+            self.idx += 1
+
+    @contextmanager
+    def transaction(self):
+        """
+        Groups several writes into a single memento. Nothing is recorded until the outermost block exits; if a block
+        raises, the state is rolled back to what it was when that block started, so nested blocks act as savepoints.
+        """
+        start = copy(self.state)
+        outermost = not self.batching
+        self.batching = True
+        try:
+            yield self
+        except BaseException:
+            self.state = start
+            raise
+        finally:
+            if outermost:
+                self.batching = False
+        if outermost and self.state != start:
+            self.snapshot()
 
     @property
     def r1(self):
@@ -37,8 +118,7 @@ class Computer:
     @r1.setter
     def r1(self, r1):
         self.state.r1 = r1
-        self.memento.append(copy(self.state))
-        self.idx += 1
+        self.snapshot()
 
     @property
     def r2(self):
@@ -47,17 +127,16 @@ class Computer:
     @r2.setter
     def r2(self, r2):
         self.state.r2 = r2
-        self.memento.append(copy(self.state))
-        self.idx += 1
+        self.snapshot()
 
     def undo(self):
         if self.idx >= 1:
-            self.state = self.memento[self.idx - 1]
+            self.state = copy(self.memento[self.idx - 1])
             self.idx -= 1
 
     def redo(self):
         if self.idx < len(self.memento) - 1:
-            self.state = self.memento[self.idx + 1]
+            self.state = copy(self.memento[self.idx + 1])
             self.idx += 1
 
     def __str__(self):
@@ -72,3 +151,25 @@ if __name__ == "__main__":
     print(computer)
     computer.redo()
     print(computer)
+    with computer.transaction():
+        computer.r1 = 2
+        computer.r2 = 3
+    print(computer)
+    computer.undo()
+    print(computer)
+
+    import tempfile
+
+    path = os.path.join(tempfile.mkdtemp(), "computer.mem")
+    history = MappedMemento(path, capacity=2)
+    computer = Computer(history)
+    for i in range(5):
+        computer.r1 = i
+    history.close()
+
+    history = MappedMemento(path)
+    computer = Computer(history)
+    print(computer, len(history))
+    computer.undo()
+    print(computer)
+    history.close()
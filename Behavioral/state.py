@@ -16,6 +16,10 @@ Key Points:
 https://refactoring.guru/design-patterns/state
 """
 
+import time
+import timeit
+from bisect import bisect
+from collections import deque
 from functools import wraps
 from enum import Enum, auto
 
@@ -58,9 +62,212 @@ def switch_state_machine():
                 command = yield "System is already online"
 
 
+"""
+The same machine can be described declaratively as a transition table and compiled into flat lookup arrays indexed by
+the position of the state and action in their enums. Each step is then a couple of list lookups instead of resuming a
+generator and matching patterns, and run() processes a whole sequence of actions in a single loop.
+"""
+
+SWITCH_TRANSITIONS = {
+    (State.OFF, Action.TURN_OFF): (State.OFF, "System is already offline"),
+    (State.OFF, Action.TURN_ON): (State.ON, "System is now online"),
+    (State.ON, Action.TURN_OFF): (State.OFF, "System is now offline"),
+    (State.ON, Action.TURN_ON): (State.ON, "System is already online"),
+}
+
+
+class StateMachine:
+
+    def __init__(self, transitions: dict, initial: Enum):
+        self.states = list(type(initial))
+        self.actions = list(type(next(iter(transitions))[1]))
+        self.width = len(self.actions)
+        state_index = {state: idx for idx, state in enumerate(self.states)}
+        # Enum members are singletons, so they can be looked up by id. This avoids calling Enum.__hash__, which is
+        # implemented in Python, on every step.
+        self.action_index = {id(action): idx for idx, action in enumerate(self.actions)}
+        self.messages = []
+        self.table = [-1] * (len(self.states) * self.width)
+        self.codes = [-1] * (len(self.states) * self.width)
+        for (state, action), (target, message) in transitions.items():
+            cell = state_index[state] * self.width + self.action_index[id(action)]
+            if message not in self.messages:
+                self.messages.append(message)
+            self.table[cell] = state_index[target]
+            self.codes[cell] = self.messages.index(message)
+        self.rows = [-1 if target < 0 else target * self.width for target in self.table]
+        self.outputs = [None if code < 0 else self.messages[code] for code in self.codes]
+        self.row = state_index[initial] * self.width
+        self.tracer = None
+
+    @property
+    def state(self):
+        return self.states[self.row // self.width]
+
+    def enable_tracing(self, trace_size: int = 1024, sample_every: int = 1):
+        self.tracer = Tracer(self, trace_size, sample_every)
+        return self.tracer
+
+    def disable_tracing(self):
+        self.tracer = None
+
+    def send(self, action: Enum):
+        cell = self.row + self.action_index[id(action)]
+        if self.rows[cell] < 0:
+            raise ValueError(f"No transition from {self.state} on {action}.")
+        self.row = self.rows[cell]
+        if self.tracer is not None:
+            self.tracer.record(cell)
+        return self.outputs[cell]
+
+    def run(self, actions) -> list:
+        if self.tracer is not None:
+            return [self.send(action) for action in actions]
+        row, rows, outputs, action_index = self.row, self.rows, self.outputs, self.action_index
+        responses = []
+        append = responses.append
+        for action in actions:
+            cell = row + action_index[id(action)]
+            if rows[cell] < 0:
+                self.row = row
+                raise ValueError(f"No transition from {self.state} on {action}.")
+            row = rows[cell]
+            append(outputs[cell])
+        self.row = row
+        return responses
+
+
+"""
+A tracer can be attached to a compiled machine to find out which transitions happen most and how long the machine stays
+in each state. It counts every transition, keeps a histogram of dwell times per state over logarithmic buckets, and
+stores every sample_every-th transition in a fixed size ring buffer. When no tracer is attached, send() pays a single
+attribute check and run() none at all; benchmark_tracing measures both.
+"""
+
+
+class Tracer:
+    # Upper bounds in seconds of the dwell time buckets, from 1 microsecond to 10 seconds. The last bucket is unbounded.
+    bounds = [10.0 ** exponent for exponent in range(-6, 2)]
+
+    def __init__(self, machine: StateMachine, trace_size: int = 1024, sample_every: int = 1):
+        self.machine = machine
+        self.sample_every = sample_every
+        self.counts = [0] * len(machine.table)
+        self.dwell = [[0] * (len(self.bounds) + 1) for _ in machine.states]
+        self.trace = deque(maxlen=trace_size)
+        self.events = 0
+        self.entered = time.perf_counter()
+
+    def record(self, cell: int):
+        now = time.perf_counter()
+        source, target = cell // self.machine.width, self.machine.table[cell]
+        self.counts[cell] += 1
+        if source != target:
+            self.dwell[source][bisect(self.bounds, now - self.entered)] += 1
+            self.entered = now
+        if self.events % self.sample_every == 0:
+            self.trace.append((now, source, cell % self.machine.width, target))
+        self.events += 1
+
+    def transitions(self) -> dict:
+        machine = self.machine
+        return {(machine.states[cell // machine.width], machine.actions[cell % machine.width]): count
+                for cell, count in enumerate(self.counts) if count}
+
+    def dwell_histograms(self) -> dict:
+        return {state: histogram for state, histogram in zip(self.machine.states, self.dwell)}
+
+    def events_trace(self) -> list:
+        machine = self.machine
+        return [(timestamp, machine.states[source], machine.actions[action], machine.states[target])
+                for timestamp, source, action, target in self.trace]
+
+
+def benchmark_tracing(steps: int = 100_000):
+    actions = [Action.TURN_ON, Action.TURN_OFF, Action.TURN_OFF] * (steps // 3)
+    machine = StateMachine(SWITCH_TRANSITIONS, State.OFF)
+    send = machine.send
+
+    def untraced_send(action: Enum):
+        # send() without the tracer check, as a baseline for the overhead of disabled tracing.
+        cell = machine.row + machine.action_index[id(action)]
+        if machine.rows[cell] < 0:
+            raise ValueError(f"No transition from {machine.state} on {action}.")
+        machine.row = machine.rows[cell]
+        return machine.outputs[cell]
+
+    baseline_send = timeit.timeit(lambda: [untraced_send(action) for action in actions], number=5)
+    disabled_send = timeit.timeit(lambda: [send(action) for action in actions], number=5)
+    disabled_run = timeit.timeit(lambda: machine.run(actions), number=5)
+    machine.enable_tracing(sample_every=64)
+    enabled_run = timeit.timeit(lambda: machine.run(actions), number=5)
+    print(f"send without tracer check: {baseline_send:.3f}s, send with tracing disabled: {disabled_send:.3f}s")
+    print(f"run with tracing disabled: {disabled_run:.3f}s, run with tracing enabled: {enabled_run:.3f}s")
+
+
+"""
+Tracking millions of devices with one machine each is wasteful, since they all share the same transition table. Instead
+the state of every device can be kept in a single small integer array and a whole array of actions, one per device, is
+applied in one vectorized lookup into the compiled table.
+"""
+
+
+class VectorizedStateMachine:
+    # NumPy is only imported here, so the rest of the module does not depend on it.
+
+    def __init__(self, machine: StateMachine, devices: int):
+        import numpy as np
+
+        self.machine = machine
+        # Missing transitions are mapped to state 0 so the table fits an unsigned type; step() rejects them by their
+        # negative output code before the state is used.
+        self.table = np.array([max(target, 0) for target in machine.table],
+                              dtype=np.min_scalar_type(len(machine.states)))
+        self.codes = np.array(machine.codes, dtype=np.int16)
+        self.states = np.full(devices, machine.row // machine.width, dtype=self.table.dtype)
+
+    def encode(self, actions):
+        import numpy as np
+
+        return np.fromiter((self.machine.action_index[id(action)] for action in actions), dtype=np.intp)
+
+    def step(self, actions):
+        """
+        Applies one action per device, given as action indices (see encode) or a single index for all devices, and
+        returns the per-device output codes, which index into machine.messages.
+        """
+        import numpy as np
+
+        cells = self.states.astype(np.intp) * self.machine.width + actions
+        codes = self.codes[cells]
+        if (codes < 0).any():
+            raise ValueError("Some devices have no transition for the given action.")
+        self.states = self.table[cells]
+        return codes
+
+
 if __name__ == '__main__':
     switch = switch_state_machine()
     print(switch.send(Action.TURN_OFF))
     print(switch.send(Action.TURN_ON))
     print(switch.send(Action.TURN_ON))
     print(switch.send(Action.TURN_OFF))
+
+    machine = StateMachine(SWITCH_TRANSITIONS, State.OFF)
+    print(machine.send(Action.TURN_ON))
+    print(machine.run([Action.TURN_ON, Action.TURN_OFF, Action.TURN_OFF]))
+
+    devices = VectorizedStateMachine(StateMachine(SWITCH_TRANSITIONS, State.OFF), 5)
+    actions = [Action.TURN_ON, Action.TURN_OFF, Action.TURN_ON, Action.TURN_ON, Action.TURN_OFF]
+    codes = devices.step(devices.encode(actions))
+    print([devices.machine.messages[code] for code in codes])
+    print([devices.machine.states[state] for state in devices.states])
+
+    machine = StateMachine(SWITCH_TRANSITIONS, State.OFF)
+    tracer = machine.enable_tracing(trace_size=4)
+    machine.run([Action.TURN_ON, Action.TURN_ON, Action.TURN_OFF, Action.TURN_ON])
+    print(tracer.transitions())
+    print(tracer.dwell_histograms())
+    print(tracer.events_trace()[-1])
+
+    benchmark_tracing()
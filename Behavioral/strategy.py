@@ -13,6 +13,16 @@ Key Points:
 https://refactoring.guru/design-patterns/strategy
 """
 
+import functools
+import json
+import os
+import sys
+import timeit
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Optional
+
 
 def filter_odd(data: list):
     return [element for element in data if element % 2 == 0]
@@ -22,6 +32,42 @@ def filter_even(data: list):
     return [element for element in data if element % 2 != 0]
 
 
+"""
+The same strategies can be implemented with NumPy, selecting elements through a boolean mask instead of a per-element
+modulo in Python. They accept NumPy arrays as they are and wrap array.array in an array view without copying it; only
+plain lists have to be converted. The parity test is a bitwise and, so these strategies only accept integer data and
+raise a TypeError for anything else, such as floats. NumPy is only imported inside these functions, so the plain
+strategies above work without it.
+"""
+
+
+def as_array(data):
+    import numpy as np
+
+    if isinstance(data, np.ndarray):
+        output = data
+    elif isinstance(data, array):
+        output = np.frombuffer(data, dtype=data.typecode)
+    else:
+        output = np.asarray(data)
+        if output.size == 0:
+            # An empty list would otherwise become a float64 array.
+            output = output.astype(np.int64)
+    if output.dtype.kind not in "iu":
+        raise TypeError(f"NumPy filter strategies only support integer data, got {output.dtype}.")
+    return output
+
+
+def filter_odd_numpy(data):
+    data = as_array(data)
+    return data[(data & 1) == 0]
+
+
+def filter_even_numpy(data):
+    data = as_array(data)
+    return data[(data & 1) != 0]
+
+
 class DataFilter:
 
     def __init__(self):
@@ -31,6 +77,151 @@ class DataFilter:
         return self.strategy(data)
 
 
+"""
+Which strategy is fastest depends on the type and size of the input. The tuned filter picks among interchangeable
+candidates by itself: the first time it sees an input type and size bucket (sizes are bucketed by powers of two), it
+times every candidate on a sample of at most sample_size elements from the start of that input. Each candidate is called
+once untimed to pay one-off costs such as starting a process pool, then the best of repeat runs is kept. The fastest
+candidate is remembered for the bucket and only it runs on the full input. The tuning table can be persisted to a JSON
+file, so later runs start already tuned. Candidates may return different container types (a list from the Python
+strategies, an ndarray from the NumPy ones), so the result is converted back to the container type of the input.
+"""
+
+
+class TunedDataFilter(DataFilter):
+
+    def __init__(self, candidates: list[Callable], tuning_file: Optional[str] = None, sample_size: int = 1 << 16,
+                 repeat: int = 5):
+        super().__init__()
+        self.candidates = {strategy.__name__: strategy for strategy in candidates}
+        self.tuning_file = tuning_file
+        self.sample_size = sample_size
+        self.repeat = repeat
+        self.table = {}
+        if tuning_file is not None and os.path.exists(tuning_file):
+            with open(tuning_file) as file:
+                self.table = {key: name for key, name in json.load(file).items() if name in self.candidates}
+
+    @staticmethod
+    def bucket(data) -> str:
+        return f"{type(data).__name__}:{len(data).bit_length()}"
+
+    @staticmethod
+    def normalise(data, result):
+        if type(result) is type(data):
+            return result
+        if isinstance(data, list):
+            return result.tolist()
+        if isinstance(data, array):
+            return array(data.typecode, result if isinstance(result, list) else result.tobytes())
+        if type(data).__module__ == "numpy":
+            import numpy as np
+
+            return np.asarray(result, dtype=data.dtype)
+        return result
+
+    def filter(self, data):
+        name = self.table.get(self.bucket(data))
+        if name is None:
+            name = self.tune(data)
+        return self.normalise(data, self.candidates[name](data))
+
+    def tune(self, data) -> str:
+        sample = data[:self.sample_size]
+        best, best_time = None, float("inf")
+        for name, strategy in self.candidates.items():
+            run = functools.partial(strategy, sample)
+            run()
+            elapsed = min(timeit.repeat(run, number=1, repeat=self.repeat))
+            if elapsed < best_time:
+                best, best_time = name, elapsed
+        self.table[self.bucket(data)] = best
+        if self.tuning_file is not None:
+            with open(self.tuning_file, "w") as file:
+                json.dump(self.table, file, indent=2)
+        return best
+
+
+"""
+For very large inputs a strategy can be run in parallel. The input is copied once into shared memory and split into
+contiguous chunks; each worker process attaches to the shared block, filters its chunk with the wrapped strategy and
+writes the selection back at the start of that same chunk, so no data is pickled in either direction. The parent then
+concatenates the selections in order. The wrapped strategy must be a module level function so workers can import it.
+"""
+
+
+def filter_chunk(strategy: Callable, name: str, dtype: str, size: int, start: int, stop: int) -> int:
+    import numpy as np
+
+    shm = SharedMemory(name=name)
+    try:
+        data = np.ndarray((size,), dtype=dtype, buffer=shm.buf)
+        result = as_array(strategy(data[start:stop]))
+        count = len(result)
+        data[start:start + count] = result
+        del data, result
+        return count
+    finally:
+        shm.close()
+
+
+class ParallelStrategy:
+
+    def __init__(self, strategy: Callable, workers: Optional[int] = None, chunks: Optional[int] = None):
+        self.strategy = strategy
+        self.workers = workers or os.cpu_count()
+        self.chunks = chunks or self.workers
+        self.__name__ = f"parallel_{strategy.__name__}"
+        self.pool = None
+
+    def __call__(self, data):
+        import numpy as np
+
+        data = as_array(data)
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.workers)
+        shm = SharedMemory(create=True, size=max(1, data.nbytes))
+        try:
+            shared = np.ndarray(data.shape, dtype=data.dtype, buffer=shm.buf)
+            shared[:] = data
+            bounds = np.linspace(0, len(data), self.chunks + 1, dtype=np.intp).tolist()
+            futures = [self.pool.submit(filter_chunk, self.strategy, shm.name, data.dtype.str, len(data), start, stop)
+                       for start, stop in zip(bounds, bounds[1:])]
+            result = np.concatenate([shared[start:start + future.result()]
+                                     for start, future in zip(bounds, futures)])
+            del shared
+            return result
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+
+def benchmark_filters(large: bool = False, python_limit: int = 10 ** 6):
+    import numpy as np
+
+    # The 1e8 element run needs several hundred MB of memory, so it only runs when asked for.
+    sizes = (10 ** 3, 10 ** 6, 10 ** 8) if large else (10 ** 3, 10 ** 6)
+    filter = DataFilter()
+    for size in sizes:
+        numbers = np.arange(size, dtype=np.int32)
+        filter.strategy = filter_odd_numpy
+        elapsed = timeit.timeit(lambda: filter.filter(numbers), number=3) / 3
+        print(f"{size:>11,} elements, numpy on ndarray: {elapsed:.6f}s")
+        if size <= python_limit:
+            values = numbers.tolist()
+            buffer = array("i", values)
+            elapsed = timeit.timeit(lambda: filter.filter(buffer), number=3) / 3
+            print(f"{size:>11,} elements, numpy on array.array: {elapsed:.6f}s")
+            filter.strategy = filter_odd
+            elapsed = timeit.timeit(lambda: filter.filter(values), number=3) / 3
+            print(f"{size:>11,} elements, python on list: {elapsed:.6f}s")
+
+
 if __name__ == '__main__':
     data = [1, 2, 3, 4, 5]
     filter = DataFilter()
@@ -38,3 +229,20 @@ if __name__ == '__main__':
     print(filter.filter(data))
     filter.strategy = filter_even
     print(filter.filter(data))
+    import numpy as np
+
+    filter.strategy = filter_even_numpy
+    print(filter.filter(array("i", data)))
+
+    tuned = TunedDataFilter([filter_odd, filter_odd_numpy])
+    for size in (10, 10 ** 6):
+        tuned.filter(list(range(size)))
+        tuned.filter(np.arange(size))
+    print(tuned.table)
+
+    parallel = ParallelStrategy(filter_odd_numpy, workers=2)
+    filter.strategy = parallel
+    print(filter.filter(np.arange(10)))
+    parallel.close()
+
+    benchmark_filters(large="--large" in sys.argv)
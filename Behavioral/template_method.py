@@ -15,7 +15,10 @@ https://refactoring.guru/design-patterns/template-method
 """
 
 from abc import ABC, abstractmethod
+from array import array
 from copy import copy
+from itertools import compress, count
+from typing import Optional
 
 
 class Filter(ABC):
@@ -47,9 +50,145 @@ class EvenFilter(Filter):
         self.data = [element for element in self.data if element % 2 == 0]
 
 
+"""
+The eager filters copy their input and materialize a new list at every stage, so chaining them copies the data once per
+filter. Lazy filters instead only record their source. Wrapping a lazy filter in another one fuses both into a single
+pipeline over the original source, and nothing is evaluated until the result is iterated. The template method here is
+__iter__, which traverses the source once and keeps the elements accepted by every stage; subclasses only provide keep.
+"""
+
+
+class LazyFilter(ABC):
+
+    def __init__(self, data):
+        if isinstance(data, LazyFilter):
+            self.source = data.source
+            self.stages = data.stages + [self]
+        else:
+            self.source = data
+            self.stages = [self]
+
+    @abstractmethod
+    def keep(self, element) -> bool:
+        pass
+
+    def __iter__(self):
+        keeps = [stage.keep for stage in self.stages]
+        if len(keeps) == 1:
+            return filter(keeps[0], self.source)
+
+        def fused(element):
+            for keep in keeps:
+                if not keep(element):
+                    return False
+            return True
+
+        return filter(fused, self.source)
+
+    def __repr__(self):
+        return f"{' -> '.join(type(stage).__name__ for stage in self.stages)} over {type(self.source).__name__}"
+
+
+class LazyOddFilter(LazyFilter):
+
+    def keep(self, element) -> bool:
+        return element % 2 != 0
+
+
+class LazyEvenFilter(LazyFilter):
+
+    def keep(self, element) -> bool:
+        return element % 2 == 0
+
+
+class LazyMultipleFilter(LazyFilter):
+
+    def __init__(self, data, divisor: int):
+        super().__init__(data)
+        self.divisor = divisor
+
+    def keep(self, element) -> bool:
+        return element % self.divisor == 0
+
+
+"""
+Inputs that already live in a buffer, such as bytes, array.array or a memory-mapped file, do not need to be turned into
+lists at all. Buffer filters read them through a memoryview, optionally cast to the element format (e.g. "i" to read a
+mmap of int32 values), so elements are decoded one at a time and the source is never copied. The selection is either
+written into a preallocated output buffer or returned as an array of indices into the source. While the filter holds its
+view the source cannot be resized or closed (an mmap raises BufferError), so use it as a context manager or call
+release() when done.
+"""
+
+
+def cast(view: memoryview, fmt: Optional[str]) -> memoryview:
+    if fmt is None or view.format == fmt:
+        return view
+    # memoryview only casts between bytes and other formats, e.g. an int32 array is read as int16 through bytes.
+    return view.cast("B").cast(fmt)
+
+
+class BufferFilter(ABC):
+
+    def __init__(self, data, fmt: Optional[str] = None):
+        self.data = cast(memoryview(data), fmt)
+
+    def release(self):
+        self.data.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    @abstractmethod
+    def keep(self, element) -> bool:
+        pass
+
+    def filter_into(self, out) -> int:
+        with memoryview(out) as view:
+            out = cast(view, self.data.format)
+            written = 0
+            for element in compress(self.data, map(self.keep, self.data)):
+                out[written] = element
+                written += 1
+            out.release()
+        return written
+
+    def indices(self) -> array:
+        return array("q", compress(count(), map(self.keep, self.data)))
+
+    def __repr__(self):
+        return f"{type(self).__name__} over {len(self.data)} elements of format {self.data.format}"
+
+
+class BufferOddFilter(BufferFilter):
+
+    def keep(self, element) -> bool:
+        return element % 2 != 0
+
+
+class BufferEvenFilter(BufferFilter):
+
+    def keep(self, element) -> bool:
+        return element % 2 == 0
+
+
 if __name__ == "__main__":
     data = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
     even = EvenFilter(data)
     print(even)
     odd = OddFilter(data)
     print(odd)
+
+    pipeline = LazyMultipleFilter(LazyEvenFilter(range(1, 10 ** 6)), 3)
+    print(pipeline)
+    print(list(pipeline)[:5])
+
+    buffer = array("i", data)
+    out = array("i", bytes(buffer.itemsize * len(buffer)))
+    written = BufferOddFilter(buffer).filter_into(out)
+    print(out[:written])
+    with BufferEvenFilter(bytes(buffer), fmt="i") as even:
+        print(even.indices())
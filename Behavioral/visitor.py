@@ -13,7 +13,59 @@ Key Points:
 https://refactoring.guru/design-patterns/visitor
 """
 
-from multimethod import multimethod
+import subprocess
+import sys
+import timeit
+from typing import Callable
+
+
+def visits(node_type: type):
+    def decorator(func: Callable):
+        func.visits = node_type
+        return func
+
+    return decorator
+
+
+def expands(node_type: type):
+    def decorator(func: Callable):
+        func.expands = node_type
+        return func
+
+    return decorator
+
+
+class Visitor:
+    """
+    Base class for visitors. Methods decorated with @visits(NodeType) handle that node type. Handlers are registered by
+    name, so a subclass can override one like any other method. Dispatch goes through a dict keyed on type(node); a
+    type without its own handler is resolved once through its MRO and then cached.
+    """
+
+    handlers = {}
+    dispatch = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.handlers = dict(cls.handlers)
+        for name, attribute in vars(cls).items():
+            if hasattr(attribute, "visits"):
+                cls.handlers[attribute.visits] = name
+        cls.dispatch = {node_type: getattr(cls, name) for node_type, name in cls.handlers.items()}
+
+    def visit(self, node):
+        handler = self.dispatch.get(type(node))
+        if handler is None:
+            handler = self.resolve(type(node))
+        return handler(self, node)
+
+    @classmethod
+    def resolve(cls, node_type: type):
+        for base in node_type.__mro__:
+            if base in cls.handlers:
+                handler = cls.dispatch[node_type] = getattr(cls, cls.handlers[base])
+                return handler
+        raise TypeError(f"{cls.__name__} cannot visit {node_type.__name__}.")
 
 
 class DoubleNode:
@@ -28,28 +80,215 @@ class AdditionNode:
         self.right = right
 
 
-class NodePrinter:
+class NodePrinter(Visitor):
 
-    @multimethod
-    def visit(self, node: DoubleNode):
+    @visits(DoubleNode)
+    def visit_double(self, node: DoubleNode):
         return str(node.value)
 
-    @visit.register
-    def _(self, node: AdditionNode):
+    @visits(AdditionNode)
+    def visit_addition(self, node: AdditionNode):
         return f"({self.visit(node.left)} + {self.visit(node.right)})"
 
 
-class NodeEvaluator:
+class NodeEvaluator(Visitor):
 
-    @multimethod
-    def visit(self, node: DoubleNode):
+    @visits(DoubleNode)
+    def visit_double(self, node: DoubleNode):
         return node.value
 
-    @visit.register
-    def _(self, node: AdditionNode):
+    @visits(AdditionNode)
+    def visit_addition(self, node: AdditionNode):
         return self.visit(node.left) + self.visit(node.right)
 
 
+"""
+The visitors above recurse once per AdditionNode, so a deep enough tree overflows the stack. An iterative visitor walks
+the tree in post-order with an explicit stack instead, and passes the results of a node's children to its handler. It
+finds the children of a node through methods decorated with @expands(NodeType), which are registered and dispatched
+like the handlers; a node type without one is a leaf.
+A static tree that is evaluated many times can also be compiled once, either into a flat postfix program run by a small
+stack machine, or into a generated Python function with one straight-line statement per node. Both read the values of
+the leaves when they run, so only the shape of the tree is fixed at compile time.
+"""
+
+
+class IterativeVisitor(Visitor):
+
+    expanders = {}
+    children = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.expanders = dict(cls.expanders)
+        for name, attribute in vars(cls).items():
+            if hasattr(attribute, "expands"):
+                cls.expanders[attribute.expands] = name
+        cls.children = {node_type: getattr(cls, name) for node_type, name in cls.expanders.items()}
+
+    def leaf(self, node) -> tuple:
+        return ()
+
+    @classmethod
+    def resolve_children(cls, node_type: type) -> Callable:
+        for base in node_type.__mro__:
+            if base in cls.expanders:
+                expander = cls.children[node_type] = getattr(cls, cls.expanders[base])
+                return expander
+        cls.children[node_type] = cls.leaf
+        return cls.leaf
+
+    def visit(self, node):
+        dispatch, children = self.dispatch, self.children
+        results = []
+        stack = [(node, False)]
+        push, pop = stack.append, stack.pop
+        while stack:
+            node, expanded = pop()
+            expander = children.get(type(node)) or self.resolve_children(type(node))
+            nodes = expander(self, node)
+            if nodes and not expanded:
+                push((node, True))
+                for child in reversed(nodes):
+                    push((child, False))
+                continue
+            handler = dispatch.get(type(node)) or self.resolve(type(node))
+            if nodes:
+                arguments = results[-len(nodes):]
+                del results[-len(nodes):]
+                results.append(handler(self, node, *arguments))
+            else:
+                results.append(handler(self, node))
+        return results[0]
+
+
+class IterativeNodeVisitor(IterativeVisitor):
+
+    @expands(AdditionNode)
+    def addition_children(self, node: AdditionNode) -> tuple:
+        return node.left, node.right
+
+
+class IterativeNodeEvaluator(IterativeNodeVisitor):
+
+    @visits(DoubleNode)
+    def visit_double(self, node: DoubleNode):
+        return node.value
+
+    @visits(AdditionNode)
+    def visit_addition(self, node: AdditionNode, left, right):
+        return left + right
+
+
+class IterativeNodePrinter(IterativeNodeVisitor):
+
+    @visits(DoubleNode)
+    def visit_double(self, node: DoubleNode):
+        return str(node.value)
+
+    @visits(AdditionNode)
+    def visit_addition(self, node: AdditionNode, left, right):
+        return f"({left} + {right})"
+
+
+class CompiledTree(IterativeNodeVisitor):
+    # Instructions are leaf indices, which push that leaf's value, or ADD, which adds the two topmost values.
+    ADD = -1
+
+    def __init__(self, tree):
+        self.leaves = []
+        self.code = []
+        self.visit(tree)
+
+    @visits(DoubleNode)
+    def visit_double(self, node: DoubleNode):
+        self.code.append(len(self.leaves))
+        self.leaves.append(node)
+
+    @visits(AdditionNode)
+    def visit_addition(self, node: AdditionNode, left, right):
+        self.code.append(self.ADD)
+
+    def evaluate(self):
+        leaves = self.leaves
+        stack = []
+        push, pop = stack.append, stack.pop
+        for instruction in self.code:
+            if instruction >= 0:
+                push(leaves[instruction].value)
+            else:
+                right = pop()
+                stack[-1] += right
+        return stack[0]
+
+    def to_function(self) -> Callable:
+        # Every stack slot becomes a local variable, so the generated code needs as many locals as the stack is deep.
+        lines = ["def evaluate(leaves):"]
+        depth = 0
+        for instruction in self.code:
+            if instruction >= 0:
+                lines.append(f"    s{depth} = leaves[{instruction}].value")
+                depth += 1
+            else:
+                depth -= 1
+                lines.append(f"    s{depth - 1} += s{depth}")
+        lines.append("    return s0")
+        namespace = {}
+        exec(compile("\n".join(lines), "<compiled tree>", "exec"), namespace)
+        evaluate, leaves = namespace["evaluate"], self.leaves
+        return lambda: evaluate(leaves)
+
+
+def balanced_tree(leaves: int):
+    nodes = [DoubleNode(value) for value in range(leaves)]
+    while len(nodes) > 1:
+        pairs = [AdditionNode(left, right) for left, right in zip(nodes[::2], nodes[1::2])]
+        nodes = pairs + nodes[len(pairs) * 2:]
+    return nodes[0]
+
+
+def import_time(module: str) -> float:
+    # Cumulative import time in seconds reported by -X importtime for the module, measured in a fresh interpreter.
+    report = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True).stderr
+    lines = [line for line in report.splitlines() if line.split("|")[-1].strip() == module]
+    return int(lines[-1].split("|")[1]) / 1e6 if lines else float("nan")
+
+
+def benchmark_visitors(leaves: int = 2 ** 19):
+    tree = balanced_tree(leaves)
+    nodes = 2 * leaves - 1
+    elapsed = timeit.timeit(lambda: NodeEvaluator().visit(tree), number=1)
+    print(f"Dispatch table visitor: {nodes / elapsed:,.0f} visits/s on {nodes:,} nodes")
+    elapsed = timeit.timeit(lambda: IterativeNodeEvaluator().visit(tree), number=1)
+    print(f"Iterative visitor: {nodes / elapsed:,.0f} visits/s on {nodes:,} nodes")
+    compiled = CompiledTree(tree)
+    elapsed = timeit.timeit(compiled.evaluate, number=5) / 5
+    print(f"Postfix program: {nodes / elapsed:,.0f} nodes/s on {nodes:,} nodes")
+    function = compiled.to_function()
+    elapsed = timeit.timeit(function, number=5) / 5
+    print(f"Generated function: {nodes / elapsed:,.0f} nodes/s on {nodes:,} nodes")
+    try:
+        from multimethod import multimethod
+    except ImportError:
+        print("multimethod is not installed, skipping the comparison")
+        return
+
+    class MultimethodEvaluator:
+
+        @multimethod
+        def visit(self, node: DoubleNode):
+            return node.value
+
+        @visit.register
+        def _(self, node: AdditionNode):
+            return self.visit(node.left) + self.visit(node.right)
+
+    elapsed = timeit.timeit(lambda: MultimethodEvaluator().visit(tree), number=1)
+    print(f"multimethod visitor: {nodes / elapsed:,.0f} visits/s on {nodes:,} nodes")
+    print(f"Import time of multimethod: {import_time('multimethod') * 1e3:.1f}ms")
+
+
 if __name__ == "__main__":
     left = DoubleNode(2)
     right = DoubleNode(3)
@@ -60,3 +299,12 @@ if __name__ == "__main__":
 
     print(printer.visit(addition))
     print(evaluator.visit(addition))
+
+    deep = DoubleNode(0)
+    for value in range(1, 100_000):
+        deep = AdditionNode(deep, DoubleNode(value))
+    print(IterativeNodeEvaluator().visit(deep))
+    compiled = CompiledTree(deep)
+    print(compiled.evaluate(), compiled.to_function()())
+
+    benchmark_visitors()
@@ -1,5 +1,10 @@
+import multiprocessing
+import os
+import threading
+import time
 from abc import abstractmethod
-from typing import Protocol
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional, Protocol, Sequence
 
 """
 The factory pattern takes out the responsibility of instantiating a object from the class to a Factory class.
@@ -36,12 +41,62 @@ class Person:
         self.last_name = last_name
 
 
+"""
+When ingesting millions of people, one Person object per call is expensive. The factories can also create people in
+bulk, as a columnar batch: a contiguous range of IDs plus one list of first names and one of last names. Individual
+people are only exposed as lightweight views into the batch, created on access.
+"""
+
+
+class PersonView:
+    __slots__ = ("batch", "index")
+
+    def __init__(self, batch: "PersonBatch", index: int) -> None:
+        self.batch = batch
+        self.index = index
+
+    @property
+    def id(self) -> int:
+        return self.batch.ids[self.index]
+
+    @property
+    def first_name(self) -> str:
+        return self.batch.first_names[self.index]
+
+    @property
+    def last_name(self) -> str:
+        return self.batch.last_names[self.index]
+
+
+class PersonBatch:
+
+    def __init__(self, first_id: int, first_names: Sequence[str], last_names: Sequence[str]) -> None:
+        if len(first_names) != len(last_names):
+            raise ValueError("First and last names must have the same length.")
+        self.ids = range(first_id, first_id + len(first_names))
+        self.first_names = list(first_names)
+        self.last_names = list(last_names)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, index: int) -> PersonView:
+        return PersonView(self, range(len(self.ids))[index])
+
+    def __iter__(self):
+        return (PersonView(self, index) for index in range(len(self.ids)))
+
+
 class IPersonFactory(Protocol):
 
     @abstractmethod
     def create_person(self, first_name: str, last_name: str) -> Person:
         raise NotImplementedError
 
+    @abstractmethod
+    def create_many(self, first_names: Sequence[str], last_names: Sequence[str]) -> PersonBatch:
+        raise NotImplementedError
+
 
 class GammaPersonFactory(IPersonFactory):
 
@@ -53,6 +108,11 @@ class GammaPersonFactory(IPersonFactory):
         self.curr_id += 1
         return operson
 
+    def create_many(self, first_names: Sequence[str], last_names: Sequence[str]) -> PersonBatch:
+        batch = PersonBatch(self.curr_id, first_names, last_names)
+        self.curr_id += len(batch)
+        return batch
+
 
 class IxiPersonFactory(IPersonFactory):
 
@@ -63,3 +123,203 @@ class IxiPersonFactory(IPersonFactory):
         operson = Person(self.curr_id, last_name, first_name)
         self.curr_id += 1
         return operson
+
+    def create_many(self, first_names: Sequence[str], last_names: Sequence[str]) -> PersonBatch:
+        batch = PersonBatch(self.curr_id, last_names, first_names)
+        self.curr_id += len(batch)
+        return batch
+
+
+"""
+Incrementing curr_id is not atomic, so factories shared between threads can hand out the same ID twice, while guarding
+every increment with a lock would serialize all threads. The concurrent factories instead take their IDs from an
+allocator that hands each thread a block of IDs claimed from a shared counter; the lock is only taken once per block.
+IDs stay unique but are no longer sequential across threads. The shared memory allocator keeps the counter in a shared
+memory block guarded by a process lock, so it can also be handed to worker processes. A forked child inherits a copy of
+its parent's thread-local blocks, so every fork bumps a generation counter and blocks from an older generation are
+discarded instead of being handed out a second time.
+"""
+
+fork_generation = 0
+
+
+def count_fork() -> None:
+    global fork_generation
+    fork_generation += 1
+
+
+# Windows has no fork, and no os.register_at_fork either.
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=count_fork)
+
+
+class BlockIdAllocator:
+
+    def __init__(self, start: int = 0, block_size: int = 1024) -> None:
+        self.next_id = start
+        self.block_size = block_size
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def claim(self, count: int) -> int:
+        with self.lock:
+            first = self.next_id
+            self.next_id += count
+        return first
+
+    def allocate(self) -> int:
+        local = self.local
+        if getattr(local, "generation", None) != fork_generation:
+            local.current = local.end = 0
+            local.generation = fork_generation
+        current = local.current
+        if current == local.end:
+            current = self.claim(self.block_size)
+            local.end = current + self.block_size
+        local.current = current + 1
+        return current
+
+    def allocate_many(self, count: int) -> range:
+        first = self.claim(count)
+        return range(first, first + count)
+
+
+class SharedIdAllocator(BlockIdAllocator):
+
+    def __init__(self, start: int = 0, block_size: int = 1024) -> None:
+        super().__init__(start, block_size)
+        self.shm = SharedMemory(create=True, size=8)
+        # Only the creating process unlinks the block; forked children inherit this attribute but not the ownership.
+        self.owner = os.getpid()
+        self.counter = self.shm.buf.cast("q")
+        self.counter[0] = start
+        self.lock = multiprocessing.Lock()
+
+    def claim(self, count: int) -> int:
+        with self.lock:
+            first = self.counter[0]
+            self.counter[0] = first + count
+        return first
+
+    def __getstate__(self) -> dict:
+        return {"name": self.shm.name, "lock": self.lock, "block_size": self.block_size}
+
+    def __setstate__(self, state: dict) -> None:
+        self.shm = SharedMemory(name=state["name"])
+        self.owner = None
+        self.counter = self.shm.buf.cast("q")
+        self.lock = state["lock"]
+        self.block_size = state["block_size"]
+        self.local = threading.local()
+
+    def close(self) -> None:
+        self.counter.release()
+        self.shm.close()
+        if self.owner == os.getpid():
+            self.shm.unlink()
+
+
+class ConcurrentGammaPersonFactory(GammaPersonFactory):
+
+    def __init__(self, allocator: Optional[BlockIdAllocator] = None):
+        self.ids = allocator or BlockIdAllocator(0)
+
+    def create_person(self, first_name: str, last_name: str) -> Person:
+        return Person(self.ids.allocate(), first_name, last_name)
+
+    def create_many(self, first_names: Sequence[str], last_names: Sequence[str]) -> PersonBatch:
+        return PersonBatch(self.ids.allocate_many(len(first_names)).start, first_names, last_names)
+
+
+class ConcurrentIxiPersonFactory(IxiPersonFactory):
+
+    def __init__(self, allocator: Optional[BlockIdAllocator] = None):
+        self.ids = allocator or BlockIdAllocator(6000)
+
+    def create_person(self, first_name: str, last_name: str) -> Person:
+        return Person(self.ids.allocate(), last_name, first_name)
+
+    def create_many(self, first_names: Sequence[str], last_names: Sequence[str]) -> PersonBatch:
+        return PersonBatch(self.ids.allocate_many(len(first_names)).start, last_names, first_names)
+
+
+class LockedIdAllocator(BlockIdAllocator):
+    # Baseline for the benchmark: takes the lock for every single ID.
+
+    def allocate(self) -> int:
+        return self.claim(1)
+
+
+def allocate_ids(allocator: BlockIdAllocator, count: int) -> None:
+    for _ in range(count):
+        allocator.allocate()
+
+
+def report_ids(allocator: BlockIdAllocator, count: int, queue) -> None:
+    queue.put([allocator.allocate() for _ in range(count)])
+
+
+def check_forked_ids(workers: int = 2, count: int = 3) -> bool:
+    # The parent holds a partly used block when the workers fork; none of them may hand out IDs from it again.
+    context = multiprocessing.get_context("fork")
+    allocator = SharedIdAllocator()
+    ids = [allocator.allocate() for _ in range(count)]
+    queue = context.Queue()
+    processes = [context.Process(target=report_ids, args=(allocator, count, queue)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ids.extend(queue.get())
+    for process in processes:
+        process.join()
+    allocator.close()
+    return len(ids) == len(set(ids))
+
+
+def benchmark_id_allocation(workers=(1, 2, 4, 8, 16, 32), ids_per_worker: int = 100_000):
+    for worker_count in workers:
+        for name, allocator in (("one lock per ID", LockedIdAllocator()), ("per-thread blocks", BlockIdAllocator())):
+            threads = [threading.Thread(target=allocate_ids, args=(allocator, ids_per_worker))
+                       for _ in range(worker_count)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            print(f"{worker_count:>2} threads, {name}: {worker_count * ids_per_worker / elapsed:,.0f} IDs/s")
+        allocator = SharedIdAllocator()
+        processes = [multiprocessing.Process(target=allocate_ids, args=(allocator, ids_per_worker))
+                     for _ in range(worker_count)]
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+        rate = worker_count * ids_per_worker / elapsed
+        print(f"{worker_count:>2} processes, shared memory blocks: {rate:,.0f} IDs/s")
+        allocator.close()
+
+
+if __name__ == "__main__":
+    gamma = GammaPersonFactory()
+    ixi = IxiPersonFactory()
+    gamma.create_person("Ada", "Lovelace")
+    people = gamma.create_many(["Alan", "Grace"], ["Turing", "Hopper"])
+    merged = ixi.create_many(["Tanaka", "Kim"], ["Hana", "Minji"])
+    for person in [*people, *merged]:
+        print(person.id, person.first_name, person.last_name)
+    print(gamma.create_person("Edsger", "Dijkstra").id, merged[-1].id)
+
+    concurrent = ConcurrentGammaPersonFactory()
+    threads = [threading.Thread(target=lambda: [concurrent.create_person("A", "B") for _ in range(5000)])
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(concurrent.create_many(["Alan"], ["Turing"])[0].id)
+    print("IDs unique across forked workers:", check_forked_ids())
+
+    benchmark_id_allocation()
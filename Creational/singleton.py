@@ -21,25 +21,52 @@ https://refactoring.guru/design-patterns/singleton
 Three different ways of achieving this pattern in python are exemplified.
 """
 
+import threading
+import time
+
+
+"""
+Checking for the instance and then creating it is a race: two threads making the first call at the same time can both
+see no instance and both create one. Double-checked locking avoids this: the lock, one per class, is only taken while
+no instance exists, and the check is repeated once it is held. After that, the decorator only checks a closure
+variable, and the metaclass reads the instance stored on the class itself, so neither takes the lock or looks the
+class up in a dict.
+"""
+
 
 def singleton(cls):
-    _instances = {}
+    instance = None
+    lock = threading.Lock()
 
     def get_instance(*args, **kwargs):
-        if cls not in _instances:
-            _instances[cls] = cls(*args, **kwargs)
-        return _instances[cls]
+        nonlocal instance
+        if instance is None:
+            with lock:
+                if instance is None:
+                    instance = cls(*args, **kwargs)
+        return instance
 
     return get_instance
 
 
 class Singleton(type):
     _instances = {}
+    _locks = {}
+    # Looked up on the class, so it falls back to this default until the class has an instance of its own.
+    _singleton_instance = None
 
     def __call__(cls, *args, **kwargs):
-        if cls not in cls._instances:
-            cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
-        return cls._instances[cls]
+        instance = cls._singleton_instance
+        # A subclass would inherit its parent's instance, hence the type check.
+        if instance is not None and type(instance) is cls:
+            return instance
+        with Singleton._locks.setdefault(cls, threading.Lock()):
+            instance = cls.__dict__.get("_singleton_instance")
+            if instance is None:
+                instance = super(Singleton, cls).__call__(*args, **kwargs)
+                cls._singleton_instance = instance
+                Singleton._instances[cls] = instance
+        return instance
 
 
 class Monostate(type):
@@ -51,29 +78,149 @@ class Monostate(type):
         return obj
 
 
-# As an example of a singleton, we show an allocator class that returns memory from a buffer as requested. This is only
-# a toy example and not terribly useful or reasonable in most cases.
+# As an example of a singleton, we show an allocator class that returns memory from a buffer as requested. It is a small
+# slab allocator over a single bytearray: requests are rounded up to a power of two size class, blocks are handed out as
+# memoryviews into the buffer, so no data is copied, and freed blocks go to a free list for their size class to be
+# reused by the next request of that class. Fresh memory is taken from the end of the used part of the buffer.
 
 class Allocator(metaclass=Singleton):
 
-    def __init__(self):
-        self.buffer = [0] * 10
+    def __init__(self, capacity: int = 1 << 20, min_block: int = 16):
+        self.buffer = bytearray(capacity)
+        self.view = memoryview(self.buffer)
+        self.min_block = min_block
         self.ptr = 0
-
-    def allocate(self, size):
-        if size + self.ptr >= len(self.buffer):
-            raise MemoryError("Out of memory.")
-        output = self.buffer[self.ptr: self.ptr + size]
-        # Having a thread switch here could lead to some hard to debug behavior.
-        self.ptr = self.ptr + size
+        self.free_lists = {}
+        # Maps id() of every view handed out to (view, offset, block size, requested size).
+        self.blocks = {}
+        self.in_use = 0
+        self.requested = 0
+        self.lock = threading.Lock()
+
+    def size_class(self, size: int) -> int:
+        return max(self.min_block, 1 << (size - 1).bit_length())
+
+    def allocate(self, size: int) -> memoryview:
+        if size <= 0:
+            raise ValueError("Size must be positive.")
+        block = self.size_class(size)
+        with self.lock:
+            free = self.free_lists.get(block)
+            if free:
+                offset = free.pop()
+            elif self.ptr + block <= len(self.buffer):
+                offset = self.ptr
+                self.ptr += block
+            else:
+                raise MemoryError("Out of memory.")
+            output = self.view[offset: offset + size]
+            self.blocks[id(output)] = (output, offset, block, size)
+            self.in_use += block
+            self.requested += size
         return output
 
+    def free(self, output: memoryview):
+        with self.lock:
+            entry = self.blocks.pop(id(output), None)
+            if entry is None or entry[0] is not output:
+                raise ValueError("Memory was not allocated by this allocator or was already freed.")
+            _, offset, block, size = entry
+            self.free_lists.setdefault(block, []).append(offset)
+            self.in_use -= block
+            self.requested -= size
+        # Only this view object is invalidated: using it afterwards raises, but slices, memoryview(output) and ctypes or
+        # NumPy buffers made from it still point into the block and silently read or write it after it is reused, so
+        # they must not outlive the free.
+        output.release()
+
+    def statistics(self) -> dict:
+        with self.lock:
+            free = sum(block * len(offsets) for block, offsets in self.free_lists.items())
+            return {
+                "capacity": len(self.buffer),
+                "used": self.ptr,
+                "in_use": self.in_use,
+                "requested": self.requested,
+                "free_listed": free,
+                # Share of the blocks in use lost to rounding up to the size class.
+                "internal_fragmentation": 1 - self.requested / self.in_use if self.in_use else 0.0,
+                # Share of the used part of the buffer sitting in free lists.
+                "external_fragmentation": free / self.ptr if self.ptr else 0.0,
+            }
+
+
+def benchmark_allocator(operations: int = 200_000, threads: int = 4):
+    alloc = Allocator()
+    sizes = [16, 24, 100, 512, 3000] * (operations // 5)
+
+    def worker():
+        live = []
+        for size in sizes:
+            live.append(alloc.allocate(size))
+            if len(live) > 32:
+                alloc.free(live.pop(0))
+        for output in live:
+            alloc.free(output)
+
+    for count in (1, threads):
+        workers = [threading.Thread(target=worker) for _ in range(count)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        print(f"{count} thread(s): {2 * count * len(sizes) / elapsed:,.0f} allocations and frees per second")
+    print(alloc.statistics())
+
+
+def benchmark_singletons(threads: int = 64, calls: int = 10_000):
+    created = []
+
+    class Expensive(metaclass=Singleton):
+        def __init__(self):
+            time.sleep(0.01)
+            created.append(self)
+
+    @singleton
+    class ExpensiveDecorated:
+        def __init__(self):
+            time.sleep(0.01)
+            created.append(self)
+
+    for name, factory in (("Singleton metaclass", Expensive), ("singleton decorator", ExpensiveDecorated)):
+        created.clear()
+        barrier = threading.Barrier(threads)
+
+        def worker():
+            barrier.wait()
+            for _ in range(calls):
+                factory()
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {len(created)} instance(s) created, {threads * calls / elapsed:,.0f} calls/s "
+              f"across {threads} threads")
+
 
 if __name__ == '__main__':
     alloc = Allocator()
     buf1 = alloc.allocate(3)
+    buf1[:] = b"abc"
 
     alloc2 = Allocator()
     buf2 = alloc2.allocate(3)
 
-    print(alloc.buffer == alloc2.buffer)
+    print(alloc.buffer is alloc2.buffer, bytes(alloc.buffer[:3]))
+    alloc.free(buf1)
+    buf3 = alloc2.allocate(5)
+    print(bytes(buf3), alloc.statistics())
+
+    benchmark_allocator()
+
+    benchmark_singletons()